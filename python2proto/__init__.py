@@ -1,6 +1,11 @@
+from collections import deque
 from collections.abc import Set
 from typing import (
+    get_args,
+    get_origin,
     get_type_hints,
+    ForwardRef,
+    Iterator,
     Type,
     Optional,
     List,
@@ -10,10 +15,19 @@ from typing import (
     TypedDict,
 )
 
+from concurrent.futures import ThreadPoolExecutor
+
 from pydantic import BaseModel
 import dataclasses
 import attr
+import functools
 import inspect
+import sys
+import types
+
+# Set to False to disable per-class field caching, e.g. when redefining
+# model classes interactively in a REPL.
+CACHE_MODEL_FIELDS = True
 
 def is_pydantic_model(cls):
     return isinstance(cls, type) and issubclass(cls, BaseModel)
@@ -24,8 +38,12 @@ def is_dataclass(cls):
 def is_attrs_class(cls):
     return attr.has(cls)
 
+# Metaclass of TypedDict subclasses, captured from a probe class rather
+# than importing the private typing._TypedDictMeta name.
+_TYPED_DICT_META = type(TypedDict('_TypedDictProbe', {}))
+
 def is_typed_dict(cls):
-    return isinstance(cls, type) and cls.__class__.__name__ == 'TypedDictMeta'
+    return type(cls) is _TYPED_DICT_META
 
 def is_regular_class(cls):
     return (
@@ -39,127 +57,316 @@ def is_regular_class(cls):
         )
     )
 
+# Model kinds settled by a single type(cls) lookup; pydantic models and
+# TypedDicts have dedicated metaclasses, the rest need attribute checks.
+_META_KINDS = {
+    type(BaseModel): 'pydantic',
+    _TYPED_DICT_META: 'typed_dict',
+}
+
+def _classify(cls):
+    # Returns the model kind for cls, or None if it is not a model.
+    # Checks mirror the is_* predicate order.
+    kind = _META_KINDS.get(type(cls))
+    if kind is not None:
+        return kind
+    if is_pydantic_model(cls):
+        return 'pydantic'
+    if is_dataclass(cls):
+        return 'dataclass'
+    if is_attrs_class(cls):
+        return 'attrs'
+    if is_typed_dict(cls):
+        return 'typed_dict'
+    if is_regular_class(cls):
+        return 'regular'
+    return None
+
 def is_model(cls):
-    # Exclude scalar types explicitly
-    if cls in (int, float, str, bool, bytes, Any):
+    # Exclude scalar types explicitly; identity checks are cheaper than
+    # a hashed lookup on this hot guard
+    if (cls is int or cls is float or cls is str or
+            cls is bool or cls is bytes or cls is Any):
         return False
-    return (
-        is_pydantic_model(cls) or
-        is_dataclass(cls) or
-        is_attrs_class(cls) or
-        is_typed_dict(cls) or
-        is_regular_class(cls)
-    )
+    return _classify(cls) is not None
 
-def get_model_fields(model):
-    if is_pydantic_model(model):
-        return get_type_hints(model)
-    elif is_dataclass(model):
-        return {field.name: field.type for field in dataclasses.fields(model)}
-    elif is_attrs_class(model):
-        return {field.name: field.type for field in attr.fields(model)}
-    elif is_typed_dict(model):
-        return model.__annotations__
-    elif is_regular_class(model):
-        # Use inspect to get instance attributes
-        attributes = inspect.getmembers(model, lambda a: not(inspect.isroutine(a)))
-        return {name: type(value) for name, value in attributes if not(name.startswith('__') and name.endswith('__'))}
+def _needs_resolution(tp):
+    # True if tp contains anything get_type_hints would have to evaluate
+    # or unwrap: stringized annotations, ForwardRefs, Annotated metadata.
+    if isinstance(tp, str) or type(tp) is ForwardRef or hasattr(tp, '__metadata__'):
+        return True
+    return any(_needs_resolution(arg) for arg in get_args(tp))
+
+def _resolved_annotations(model):
+    # Merge __annotations__ across the MRO the way get_type_hints does,
+    # but without evaluating anything; returns None if any annotation
+    # still needs resolving, in which case the caller must fall back.
+    hints = {}
+    for klass in reversed(model.__mro__):
+        for name, value in vars(klass).get('__annotations__', {}).items():
+            if _needs_resolution(value):
+                return None
+            hints[name] = value
+    return hints
+
+@functools.lru_cache(maxsize=None)
+def _fields_for(model):
+    # Returns (name, type) pairs as a tuple so the cached value is immutable.
+    kind = _classify(model)
+    if kind == 'pydantic':
+        # get_type_hints re-evaluates and walks the MRO on every call;
+        # when the annotations are already plain type objects they can
+        # be read directly
+        hints = _resolved_annotations(model)
+        if hints is None:
+            hints = get_type_hints(model)
+        return tuple(hints.items())
+    elif kind == 'dataclass':
+        return tuple((field.name, field.type) for field in dataclasses.fields(model))
+    elif kind == 'attrs':
+        return tuple((field.name, field.type) for field in attr.fields(model))
+    elif kind == 'typed_dict':
+        return tuple(model.__annotations__.items())
+    elif kind == 'regular':
+        # Walk the MRO __dict__s directly instead of inspect.getmembers,
+        # which getattr's every attribute and sorts the full dir() of the
+        # class. Most-derived definition of a name wins, as with getattr.
+        attributes = {}
+        seen = set()
+        for klass in model.__mro__:
+            for name, value in vars(klass).items():
+                if name in seen:
+                    continue
+                seen.add(name)
+                if name.startswith('__') and name.endswith('__'):
+                    continue
+                # classmethod/staticmethod resolve to routines under
+                # getattr, so exclude them like getmembers did
+                if inspect.isroutine(value) or isinstance(value, (classmethod, staticmethod)):
+                    continue
+                attributes[name] = type(value)
+        return tuple((name, attributes[name]) for name in sorted(attributes))
     else:
-        return {}
+        return ()
+
+def get_model_fields(model):
+    if CACHE_MODEL_FIELDS:
+        return dict(_fields_for(model))
+    return dict(_fields_for.__wrapped__(model))
+
+# Scalar types make up the majority of fields, so membership is checked
+# before any generic-alias introspection.
+_SCALARS = frozenset({int, float, str, bool, bytes, Any})
+
+# Rendered message text per model class, plus the nested model classes
+# referenced by its fields. A class's message is deterministic, so a
+# repeat encounter replays the cached text instead of re-walking the
+# fields. Gated by CACHE_MODEL_FIELDS like the field cache.
+_MESSAGE_CACHE: Dict[type, tuple] = {}
+
+_NONE_TYPE = type(None)
+
+def _handle_union(field_type):
+    # Only Optional[X] is special-cased; other unions fall through
+    # unchanged. One pass over get_args suffices: NoneType is detected
+    # by identity while the first real member is remembered.
+    optional = False
+    inner = None
+    for arg in get_args(field_type):
+        if arg is _NONE_TYPE:
+            optional = True
+        elif inner is None:
+            inner = arg
+    if optional:
+        return (inner if inner is not None else Any, False, True, None)
+    return (field_type, False, False, None)
+
+def _handle_list(field_type):
+    return (field_type.__args__[0], True, False, None)
+
+def _handle_dict(field_type):
+    key_type, value_type = field_type.__args__ if field_type.__args__ else (Any, Any)
+    return (field_type, False, False, (key_type, value_type))
+
+# Dispatch on typing.get_origin: one C-level call plus a dict lookup
+# instead of repeated __origin__ attribute probes per field.
+_ORIGIN_HANDLERS = {
+    Union: _handle_union,
+    list: _handle_list,
+    dict: _handle_dict,
+}
+
+# Hoisted out of map_scalar_type so the dict is built once, not per call;
+# wrapped in a MappingProxyType to signal it is read-only.
+_SCALAR_MAP = types.MappingProxyType({
+    int: 'int32',
+    float: 'float',
+    str: 'string',
+    bool: 'bool',
+    bytes: 'bytes',
+    Any: 'string',
+})
 
 def map_scalar_type(py_type: Type) -> str:
-    type_mapping = {
-        int: 'int32',
-        float: 'float',
-        str: 'string',
-        bool: 'bool',
-        bytes: 'bytes',
-        Any: 'string',
-    }
-    return type_mapping.get(py_type, 'string')  # Default to 'string' if type not mapped
+    return _SCALAR_MAP.get(py_type, 'string')  # Default to 'string' if type not mapped
+
+# '<rule> <type> ' prefixes shared across field lines, so equal prefixes
+# reuse one string instead of being re-concatenated per field.
+_FIELD_PREFIXES: Dict[tuple, str] = {}
 
 def map_type(py_type: Type) -> str:
-    if py_type in (int, float, str, bool, bytes, Any):
+    if py_type in _SCALARS:
         return map_scalar_type(py_type)
     elif is_model(py_type):
-        return py_type.__name__
+        # Intern so repeated references to the same message name share
+        # one string and compare by identity downstream
+        return sys.intern(py_type.__name__)
     else:
         # Default to 'string' for unknown types
         return 'string'
 
-def pydantic_models_to_protos(models: List[Type], already_visited: Optional[Set[Type]] = None) -> str:
+def iter_proto_messages(models: List[Type], already_visited: Optional[Set[Type]] = None) -> Iterator[str]:
     """
-    Converts a list of models to a Protobuf schema string.
+    Yields the Protobuf message definitions for a list of models, one message at a time.
     Args:
         models: List of model classes to convert.
         already_visited: Set of models that have already been visited to avoid circular references.
-    Returns:
-        A string containing the Protobuf schema definition.
+    Yields:
+        Strings, each containing one Protobuf message definition.
     """
-    proto_messages = []
-    visited_models = already_visited or set()
+    # Messages are produced depth-first (nested definitions first) but
+    # emitted schema-first; prepending to a deque keeps them in final
+    # order so no reversal pass is needed at the end
+    proto_messages = deque()
+    visited_models = set() if already_visited is None else already_visited
+
+    # Bind hot globals and bound methods to locals once per call; inside
+    # the field loop a local load is much cheaper than a global/attribute
+    # lookup
+    scalars = _SCALARS
+    origin_handlers_get = _ORIGIN_HANDLERS.get
+    check_is_model = is_model
+    to_proto_type = map_type
+    mark_visited = visited_models.add
+    emit_message = proto_messages.appendleft
 
-    def parse_model(model: Type, message_name: str) -> None:
+    # Explicit work stack instead of recursion: entries are either model
+    # classes still to visit or finished message strings to emit. A
+    # model pushes its message first and its nested models on top (in
+    # reverse field order), so nested definitions are emitted before the
+    # message that references them — the same post-order as the old
+    # recursive walk, without a Python frame per nesting level.
+    stack = list(reversed(models))
+    while stack:
+        entry = stack.pop()
+        if type(entry) is str:
+            emit_message(entry)
+            continue
+
+        model = entry
         if model in visited_models:
-            return
-        visited_models.add(model)
+            continue
+        mark_visited(model)
+        message_name = model.__name__
+
+        cached = _MESSAGE_CACHE.get(model) if CACHE_MODEL_FIELDS else None
+        if cached is not None:
+            message, nested = cached
+            stack.append(message)
+            stack.extend(reversed(nested))
+            continue
 
-        fields = []
+        # Struct-of-arrays field table: parallel lists of line prefixes
+        # ('<rule> <type> ' or 'map<k, v> ') and field names, rendered in
+        # a single pass once the whole message is parsed
+        field_prefixes = []
+        field_names = []
+        nested = []
+        append_prefix = field_prefixes.append
+        append_name = field_names.append
         type_hints = get_model_fields(model)
-        idx = 1
         for field_name, field_type in type_hints.items():
             repeated = False
             optional = False
 
-            # Handle Optional types
-            if getattr(field_type, '__origin__', None) is Union:
-                args = field_type.__args__
-                if type(None) in args:
-                    optional = True
-                    args = tuple(arg for arg in args if arg is not type(None))
-                    field_type = args[0] if args else Any
-
-            # Handle List types
-            elif getattr(field_type, '__origin__', None) in (list, List):
-                repeated = True
-                field_type = field_type.__args__[0]
-
-            # Handle Dict types (maps)
-            elif getattr(field_type, '__origin__', None) in (dict, Dict):
-                key_type, value_type = field_type.__args__ if field_type.__args__ else (Any, Any)
-                # Use 'string' as default key and value types if unspecified
-                key_type_name = map_scalar_type(key_type) if key_type in (int, float, str, bool) else 'string'
-                if is_model(value_type):
-                    parse_model(value_type, value_type.__name__)
-                    value_type_name = value_type.__name__
-                else:
-                    value_type_name = map_type(value_type)
-                field_line = f"map<{key_type_name}, {value_type_name}> {field_name} = {idx};"
-                fields.append(field_line)
-                idx += 1
-                continue
-
-            # Recursively parse nested models
-            if is_model(field_type):
-                parse_model(field_type, field_type.__name__)
-                field_type_name = field_type.__name__
+            # Scalars are the common case and need no origin inspection
+            if field_type not in scalars:
+                handler = origin_handlers_get(get_origin(field_type))
+                if handler is not None:
+                    field_type, repeated, optional, map_kv = handler(field_type)
+                    if map_kv is not None:
+                        key_type, value_type = map_kv
+                        # Use 'string' as default key and value types if unspecified
+                        key_type_name = map_scalar_type(key_type) if key_type in (int, float, str, bool) else 'string'
+                        if check_is_model(value_type):
+                            nested.append(value_type)
+                            value_type_name = value_type.__name__
+                        else:
+                            value_type_name = to_proto_type(value_type)
+                        append_prefix(f"map<{key_type_name}, {value_type_name}> ")
+                        append_name(field_name)
+                        continue
+
+            # Schedule nested models for their own messages
+            if check_is_model(field_type):
+                nested.append(field_type)
+                field_type_name = sys.intern(field_type.__name__)
             else:
-                field_type_name = map_type(field_type)
+                field_type_name = to_proto_type(field_type)
 
-            field_rule = 'repeated' if repeated else ''
-            field_line = f"{field_rule} {field_type_name} {field_name} = {idx};".strip()
-            fields.append(field_line)
-            idx += 1
+            prefix_key = (repeated, field_type_name)
+            prefix = _FIELD_PREFIXES.get(prefix_key)
+            if prefix is None:
+                # Branch on the rule instead of formatting an empty rule
+                # into the line and stripping it back out
+                if repeated:
+                    prefix = f"repeated {field_type_name} "
+                else:
+                    prefix = f"{field_type_name} "
+                _FIELD_PREFIXES[prefix_key] = prefix
+            append_prefix(prefix)
+            append_name(field_name)
 
-        # Build the message definition
-        message = f"message {message_name} {{\n"
-        for field in fields:
-            message += f"    {field};\n"
-        message += "}\n"
-        proto_messages.append(message)
+        # Render the field table and build the message in one join
+        # instead of repeated string concatenation
+        lines = [f"message {message_name} {{"]
+        lines.extend(
+            f"    {prefix}{name} = {number};"
+            for number, (prefix, name) in enumerate(zip(field_prefixes, field_names), 1)
+        )
+        lines.append("}\n")
+        message = "\n".join(lines)
+        if CACHE_MODEL_FIELDS:
+            _MESSAGE_CACHE[model] = (message, tuple(nested))
+        stack.append(message)
+        stack.extend(reversed(nested))
 
-    for model in models:
-        parse_model(model, model.__name__)
+    # Messages are discovered nested-first but emitted schema-first, so
+    # yielding can only begin once the walk is complete; callers still
+    # consume one message string at a time instead of one big string
+    yield from proto_messages
 
-    proto_schema = '\n'.join(reversed(proto_messages))
-    return proto_schema 
\ No newline at end of file
+def pydantic_models_to_protos(models: List[Type], already_visited: Optional[Set[Type]] = None) -> str:
+    """
+    Converts a list of models to a Protobuf schema string.
+    Args:
+        models: List of model classes to convert.
+        already_visited: Set of models that have already been visited to avoid circular references.
+    Returns:
+        A string containing the Protobuf schema definition.
+    """
+    return '\n'.join(iter_proto_messages(models, already_visited))
+
+def pydantic_models_to_protos_batch(model_groups: List[List[Type]], max_workers: Optional[int] = None) -> List[str]:
+    """
+    Converts several independent groups of models to Protobuf schemas concurrently.
+    Args:
+        model_groups: List of model groups; each group is converted on its own,
+            with its own visited set, as if passed to pydantic_models_to_protos.
+        max_workers: Maximum number of worker threads (defaults to the
+            ThreadPoolExecutor default).
+    Returns:
+        A list of Protobuf schema strings, one per group, in input order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(pydantic_models_to_protos, model_groups)) 
\ No newline at end of file